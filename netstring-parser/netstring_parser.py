@@ -124,7 +124,7 @@ class CalcParser(object):
                     print("ERROR! Expected another netstring to begin due to leading zero in the upper container.")
                     return ''
                 if len(self.container_stack) == 0:
-                    print("ERROR! Expected a length-prefix definition at string-position: " str(self.cur_pos-1)))
+                    print("ERROR! Expected a length-prefix definition at string-position: " + str(self.cur_pos-1))
                     return ''
                 self._match(',')
                 if not self.container_stack[-1] < self.cur_pos:
@@ -0,0 +1,269 @@
+import collections
+import contextlib
+import io
+import sys
+
+from netstring_parser import CalcParser, ParseError
+
+
+# Exceptions the parser raises deterministically for malformed input.
+# These are cached and re-raised on hits like ParseError.
+CACHED_ERRORS = (ParseError, ValueError, IndexError, TypeError)
+
+
+def _encoded_size(text):
+    return len(text.encode('utf-8'))
+
+
+class CacheEntry(object):
+    """ Validation outcome and structural summary of one parsed line.
+
+        result:
+            The string returned by CalcParser.parse(), or None if
+            an exception was raised.
+
+        exception_type, exception_args:
+            Type and arguments of the exception raised while parsing,
+            or None. The exception object itself is not kept, so the
+            entry does not pin the parser frames of its traceback.
+
+        messages:
+            Diagnostics the parser printed while parsing the line.
+
+        position:
+            Position the parser reached (CalcParser.cur_pos). When a
+            match fails this includes the symbol that did not match.
+
+        outer_size:
+            Position at which the outermost container ends, or None
+            if the line did not open a container.
+
+        closed:
+            True if every container opened while parsing was closed.
+
+        complete:
+            True if the parser reproduced the whole input (whitespace
+            aside) and it ends with a terminating ','.
+
+        size:
+            UTF-8 encoded size in bytes of the text held by this entry
+            (line, result and messages). The overhead of the Python
+            objects themselves is not counted.
+    """
+    def __init__(self, line, result, exception_type, exception_args, messages, position, outer_size, closed):
+        self.result = result
+        self.exception_type = exception_type
+        self.exception_args = exception_args
+        self.messages = messages
+        self.position = position
+        self.outer_size = outer_size
+        self.closed = closed
+        stripped = ''.join(line.split())
+        self.complete = result == stripped and stripped.endswith(',')
+        self.size = _encoded_size(line) + _encoded_size(result or '') + _encoded_size(messages)
+
+    @property
+    def error(self):
+        if self.exception_type is None:
+            return None
+        return str(self.exception_type(*self.exception_args))
+
+    @property
+    def valid(self):
+        """ True only if the line is one well-formed netstring: nothing
+            was raised or printed, the whole input was consumed and all
+            containers were closed.
+        """
+        return self.exception_type is None and not self.messages and self.complete and self.closed
+
+
+class ParseCache(object):
+    """ A bounded LRU cache in front of CalcParser.
+
+        Identical input lines are answered from the cache without
+        lexing or validating them again. The cache is limited both
+        in the number of entries and in the number of bytes held
+        (UTF-8 size of the input line, result and diagnostics); the
+        least recently used entries are evicted first.
+
+        The parser reports problems by printing them, so diagnostics
+        are captured by redirecting sys.stdout during a miss. That
+        redirection is process-wide: use the cache from a single
+        thread only, otherwise output of other threads may end up in
+        a cached entry.
+    """
+    def __init__(self, max_entries=1024, max_bytes=1 << 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.cur_bytes = 0
+        # Keyed by the input line itself: str hashes are computed once
+        # and cached by Python, and equality is checked on collisions.
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, line):
+        return line in self._entries
+
+    def parse(self, line):
+        """ Parse a line like CalcParser.parse(), reusing a cached
+            result for lines that have been seen before.
+            Diagnostics are printed and exceptions are raised exactly
+            as on the first parse of the line.
+        """
+        entry = self.lookup(line)
+        sys.stdout.write(entry.messages)
+        if entry.exception_type is not None:
+            raise entry.exception_type(*entry.exception_args)
+        return entry.result
+
+    def lookup(self, line):
+        """ Return the CacheEntry for a line, parsing it on a miss.
+        """
+        entry = self._entries.get(line)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(line)
+            return entry
+
+        self.misses += 1
+        entry = self._validate(line)
+        self._store(line, entry)
+        return entry
+
+    def clear(self):
+        self._entries.clear()
+        self.cur_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _validate(self, line):
+        # CalcParser keeps its position state across calls and its
+        # container stack on the class, so every line gets a fresh one.
+        parser = CalcParser()
+        parser.container_stack = []
+        result = None
+        exception_type = None
+        exception_args = None
+        out = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(out):
+                try:
+                    result = parser.parse(line)
+                except CACHED_ERRORS as e:
+                    exception_type = type(e)
+                    exception_args = e.args
+        except BaseException:
+            # Not cached, so nobody will replay what was printed.
+            sys.stdout.write(out.getvalue())
+            raise
+        # The outermost container's boundary stays on the stack as a
+        # sentinel; anything above it is a container left open.
+        closed = parser.container_stack in ([], [parser.outer_size])
+        # outer_flag is only cleared once the outermost container is read,
+        # before that outer_size is just the class default.
+        outer_size = None if parser.outer_flag else parser.outer_size
+        return CacheEntry(line, result, exception_type, exception_args, out.getvalue(), parser.cur_pos,
+                          outer_size, closed)
+
+    def _store(self, line, entry):
+        if self.max_entries <= 0 or entry.size > self.max_bytes:
+            return
+        self._entries[line] = entry
+        self.cur_bytes += entry.size
+        while len(self._entries) > self.max_entries or self.cur_bytes > self.max_bytes:
+            old_entry = self._entries.popitem(last=False)[1]
+            self.cur_bytes -= old_entry.size
+
+
+if __name__ == '__main__':
+    quiet = io.StringIO()
+
+    # structural summary: only complete, closed netstrings are valid
+    c = ParseCache()
+    for line in ['3:abc,', '09:2:ad,1:d,,', '024:011:3:abc,2:cd,,5:abcde,,', '0:,', '03:0:,,']:
+        assert c.lookup(line).valid, line
+    with contextlib.redirect_stdout(quiet):
+        for line in ['', '0:', '1:', '3:ab', '3:abc,tgdfr', '03:0:,', '05:1:a,', '04:03:abc,,', '3:abcd,', '0']:
+            assert not c.lookup(line).valid, line
+
+    # hit/miss counting
+    c = ParseCache()
+    c.lookup('3:abc,')
+    c.lookup('3:abc,')
+    c.lookup('1:d,')
+    assert (c.hits, c.misses, len(c)) == (1, 2, 2)
+
+    # LRU order: a hit protects an entry from eviction
+    c = ParseCache(max_entries=2)
+    c.lookup('1:a,')
+    c.lookup('1:b,')
+    c.lookup('1:a,')
+    c.lookup('1:c,')
+    assert '1:a,' in c and '1:c,' in c and '1:b,' not in c
+
+    # eviction by byte budget; cur_bytes matches the entries held
+    entry_size = CacheEntry('1:a,', '1:a,', None, None, '', 0, None, True).size
+    c = ParseCache(max_bytes=2 * entry_size)
+    for line in ['1:a,', '1:b,', '1:c,']:
+        c.lookup(line)
+    assert len(c) == 2 and '1:a,' not in c
+    assert c.cur_bytes == sum(e.size for e in c._entries.values()) == 2 * entry_size
+    c.clear()
+    assert (len(c), c.cur_bytes, c.hits, c.misses) == (0, 0, 0, 0)
+
+    # entries larger than max_bytes are skipped, bytes are UTF-8 bytes
+    c = ParseCache(max_bytes=entry_size)
+    c.lookup('1:ä,')
+    assert len(c) == 0 and c.cur_bytes == 0
+    c.lookup('1:a,')
+    assert len(c) == 1 and c.cur_bytes == entry_size
+
+    # max_entries=0 disables caching
+    c = ParseCache(max_entries=0)
+    c.lookup('1:a,')
+    c.lookup('1:a,')
+    assert (c.hits, c.misses, len(c)) == (0, 2, 0)
+
+    # hits replay diagnostics and re-raise the same exception
+    c = ParseCache()
+    for line, exc_type in [('3:abcd,', ParseError), ('0', ValueError)]:
+        outputs = []
+        for _ in range(2):
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                try:
+                    c.parse(line)
+                    raise AssertionError(line)
+                except exc_type as e:
+                    outputs.append((out.getvalue(), str(e)))
+        assert outputs[0] == outputs[1], line
+    outputs = []
+    for _ in range(2):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            outputs.append((c.parse('04:03:abc,,'), out.getvalue()))
+    assert outputs[0] == outputs[1] and outputs[0][1].startswith('ERROR!')
+    assert (c.hits, c.misses) == (3, 3)
+
+    # outer_size is only set for containers; position includes a failed match
+    c = ParseCache()
+    assert c.lookup('3:abc,').outer_size is None
+    assert c.lookup('09:2:ad,1:d,,').outer_size == 13
+    assert c.lookup('3:abcd,').position == 6
+
+    # error entries keep no parser objects alive through a traceback
+    import gc
+    gc.collect()
+    gc.disable()
+    try:
+        entry = ParseCache().lookup('0' + str(4 * 700) + ':' + '1:a,' * 700 + ';')
+        assert entry.exception_type is ParseError
+        assert not [o for o in gc.get_objects() if isinstance(o, CalcParser)]
+    finally:
+        gc.enable()
+
+    print("all parse cache checks passed")